@@ -1,23 +1,101 @@
+import asyncio
+import collections
+import httpx
 import requests
-import json
 import numpy as np
+import orjson
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import urllib3
+from requests.adapters import HTTPAdapter
 import getpass
+import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import torch
+    import torch.nn.functional as F
+except ImportError:
+    torch = None
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
 
 # Suppress only the single InsecureRequestWarning from urllib3 needed for this script
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+logger = logging.getLogger(__name__)
+
+# Shared generator for all random draws, faster than the legacy global
+# RandomState and able to produce float32 directly
+RNG = np.random.default_rng(seed=0)
+
 # Define your dynamic variables
 token = None
-host = "http://127.0.0.1:8443"
+# Point at the https:// listener (server.mode = "https") to have upserts
+# multiplexed over HTTP/2, the plain http:// listener only speaks HTTP/1.1
+host = os.environ.get("COSDATA_HOST", "http://127.0.0.1:8443")
 base_url = f"{host}/vectordb"
 
-
-def generate_headers():
-    return {"Authorization": f"Bearer {token}", "Content-type": "application/json"}
+# Vectors per upsert request, halved until the encoded body fits under the
+# server's JSON body limit (8 MB by default)
+MACRO_BATCH = 4096
+MAX_BODY_BYTES = 8_388_608
+
+# Number of encoded upsert bodies prepared ahead of the uploader
+PREFETCH_BATCHES = 16
+
+# Processes serializing upsert bodies, each keeps one MACRO_BATCH in flight
+ENCODE_WORKERS = min(8, os.cpu_count() or 1)
+
+# Rows handled at once when generating or scanning the quantized corpus
+GENERATE_BLOCK = 65536
+BRUTEFORCE_BLOCK = 16384
+
+# Shared session for control-plane calls, keeps connections alive between
+# requests instead of opening a new pool per call
+SESSION = requests.Session()
+SESSION.mount(
+    "http://", HTTPAdapter(pool_connections=1, pool_maxsize=128, max_retries=0)
+)
+SESSION.mount(
+    "https://", HTTPAdapter(pool_connections=1, pool_maxsize=128, max_retries=0)
+)
+SESSION.headers.update({"Content-type": "application/json"})
+# Only takes effect for an https:// host, configured once instead of per call
+SESSION.verify = False
+
+# Shared async client for the upsert hot path, a single connection pool is
+# reused by every concurrent request instead of one blocking call per thread
+client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=128, max_keepalive_connections=128),
+    headers={"Content-type": "application/json"},
+    timeout=None,
+    verify=False,
+)
+
+
+def setup_logging(level="INFO"):
+    # Callers only enqueue records, a single background thread drains the
+    # queue to stderr so concurrent requests never contend on stream writes
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    return listener
 
 
 def create_session():
@@ -29,12 +107,13 @@ def create_session():
         password = getpass.getpass("Enter admin password: ")
 
     data = {"username": "admin", "password": password}
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
-    )
+    response = SESSION.post(url, data=encode_json(data))
     session = response.json()
     global token
     token = session["access_token"]
+    # Both clients send the token with every request from here on
+    SESSION.headers.update({"Authorization": f"Bearer {token}"})
+    client.headers.update({"Authorization": f"Bearer {token}"})
     return token
 
 
@@ -52,15 +131,15 @@ def create_db(name, description=None, dimension=1024):
         "metadata_schema": None,
         "config": {"max_vectors": None, "replication_factor": None},
     }
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
-    )
+    response = SESSION.post(url, data=encode_json(data))
     return response.json()
 
 
 def create_explicit_index(name):
     data = {
         "name": name,
+        # Prefer "dot_product" here: uploads are within int8 rounding of unit
+        # length, so it ranks like "cosine" without the server-side norms
         "distance_metric_type": "cosine",
         "quantization": {"type": "auto", "properties": {"sample_threshold": 100}},
         "index": {
@@ -75,11 +154,9 @@ def create_explicit_index(name):
             },
         },
     }
-    response = requests.post(
+    response = SESSION.post(
         f"{base_url}/collections/{name}/indexes/dense",
-        headers=generate_headers(),
-        data=json.dumps(data),
-        verify=False,
+        data=encode_json(data),
     )
 
     return response.json()
@@ -94,9 +171,7 @@ def create_db_old(vector_db_name, dimensions, max_val, min_val):
         "max_val": max_val,
         "min_val": min_val,
     }
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
-    )
+    response = SESSION.post(url, data=encode_json(data))
     return response.json()
 
 
@@ -104,42 +179,83 @@ def create_db_old(vector_db_name, dimensions, max_val, min_val):
 def find_collection(id):
     url = f"{base_url}/collections/{id}"
 
-    response = requests.get(url, headers=generate_headers(), verify=False)
+    response = SESSION.get(url)
     return response.json()
 
 
 def create_transaction(collection_name):
     url = f"{base_url}/collections/{collection_name}/transactions"
-    response = requests.post(url, headers=generate_headers(), verify=False)
+    response = SESSION.post(url)
     return response.json()
 
 
 def create_vector_in_transaction(collection_name, transaction_id, vector):
     url = f"{base_url}/collections/{collection_name}/transactions/{transaction_id}/vectors"
     data = {"id": vector["id"], "values": vector["values"], "metadata": {}}
-    print(f"Request URL: {url}")
-    print(f"Request Data: {json.dumps(data)}")
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
-    )
-    print(f"Response Status: {response.status_code}")
-    print(f"Response Text: {response.text}")
+    body = encode_json(data)
+    logger.debug("Request URL: %s", url)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Request Data: %s", body.decode())
+    response = SESSION.post(url, data=body)
+    logger.debug("Response Status: %s", response.status_code)
+    logger.debug("Response Text: %s", response.text)
     if response.status_code not in [200, 204]:
         raise Exception(f"Failed to create vector: {response.status_code}")
     return response.json() if response.text else None
 
 
-def upsert_in_transaction(collection_name, transaction_id, vectors):
+def encode_json(data):
+    # ndarray values are serialized straight from their buffers
+    return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def encode_upsert_payload(vectors):
+    return encode_json({"vectors": vectors})
+
+
+async def post_upsert(collection_name, transaction_id, body):
     url = (
         f"{base_url}/collections/{collection_name}/transactions/{transaction_id}/upsert"
     )
-    data = {"vectors": vectors}
-    print(f"Request URL: {url}")
-    print(f"Request Vectors Count: {len(vectors)}")
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
+    logger.debug("Request URL: %s", url)
+    response = await client.post(url, content=body)
+    logger.debug(
+        "Response Status: %s (%s)", response.status_code, response.http_version
     )
-    print(f"Response Status: {response.status_code}")
+    return response
+
+
+async def upsert_in_transaction(collection_name, transaction_id, vectors):
+    logger.debug("Request Vectors Count: %d", len(vectors))
+    response = await post_upsert(
+        collection_name, transaction_id, encode_upsert_payload(vectors)
+    )
+    if response.status_code not in [200, 204]:
+        raise Exception(f"Failed to create vector: {response.status_code}")
+
+
+async def upsert_range_in_transaction(
+    collection_name, transaction_id, ids, codes, scales, lo, hi, body=None
+):
+    if body is None:
+        body = encode_upsert_payload(slice_batch(codes, scales, ids, lo, hi))
+    logger.debug("Request Vectors Count: %d", hi - lo)
+    response = await post_upsert(collection_name, transaction_id, body)
+    if response.status_code == 413 and hi - lo > 1:
+        # The server's body limit is below MAX_BODY_BYTES, retry as two halves
+        logger.warning(
+            "Upsert of %d vectors (%d bytes) too large, splitting it in half",
+            hi - lo,
+            len(body),
+        )
+        mid = (lo + hi) // 2
+        await upsert_range_in_transaction(
+            collection_name, transaction_id, ids, codes, scales, lo, mid
+        )
+        await upsert_range_in_transaction(
+            collection_name, transaction_id, ids, codes, scales, mid, hi
+        )
+        return
     if response.status_code not in [200, 204]:
         raise Exception(f"Failed to create vector: {response.status_code}")
 
@@ -147,9 +263,7 @@ def upsert_in_transaction(collection_name, transaction_id, vectors):
 def upsert_vectors_in_transaction(collection_name, transaction_id, vectors):
     url = f"{base_url}/collections/{collection_name}/transactions/{transaction_id}/vectors"
     data = {"vectors": vectors}
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
-    )
+    response = SESSION.post(url, data=encode_json(data))
     return response.json()
 
 
@@ -157,7 +271,7 @@ def commit_transaction(collection_name, transaction_id):
     url = (
         f"{base_url}/collections/{collection_name}/transactions/{transaction_id}/commit"
     )
-    response = requests.post(url, headers=generate_headers(), verify=False)
+    response = SESSION.post(url)
     if response.status_code not in [200, 204]:
         print(f"Error response: {response.text}")
         raise Exception(f"Failed to commit transaction: {response.status_code}")
@@ -168,7 +282,7 @@ def abort_transaction(collection_name, transaction_id):
     url = (
         f"{base_url}/collections/{collection_name}/transactions/{transaction_id}/abort"
     )
-    response = requests.post(url, headers=generate_headers(), verify=False)
+    response = SESSION.post(url)
     return response.json()
 
 
@@ -176,9 +290,7 @@ def abort_transaction(collection_name, transaction_id):
 def upsert_vector(vector_db_name, vectors):
     url = f"{base_url}/upsert"
     data = {"vector_db_name": vector_db_name, "vectors": vectors}
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
-    )
+    response = SESSION.post(url, data=encode_json(data))
     return response.json()
 
 
@@ -186,18 +298,14 @@ def upsert_vector(vector_db_name, vectors):
 def ann_vector_old(idd, vector_db_name, vector):
     url = f"{base_url}/search"
     data = {"vector_db_name": vector_db_name, "vector": vector}
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
-    )
+    response = SESSION.post(url, data=encode_json(data))
     return (idd, response.json())
 
 
 def ann_vector(idd, vector_db_name, vector):
     url = f"{base_url}/search"
     data = {"vector_db_name": vector_db_name, "vector": vector, "nn_count": 5}
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
-    )
+    response = SESSION.post(url, data=encode_json(data))
     if response.status_code != 200:
         print(f"Error response: {response.text}")
         raise Exception(f"Failed to search vector: {response.status_code}")
@@ -213,65 +321,46 @@ def ann_vector(idd, vector_db_name, vector):
 def fetch_vector(vector_db_name, vector_id):
     url = f"{base_url}/fetch"
     data = {"vector_db_name": vector_db_name, "vector_id": vector_id}
-    response = requests.post(
-        url, headers=generate_headers(), data=json.dumps(data), verify=False
-    )
+    response = SESSION.post(url, data=encode_json(data))
     return response.json()
 
 
 # Function to generate a random vector with given constraints
 def generate_random_vector(rows, dimensions, min_val, max_val):
-    return np.random.uniform(min_val, max_val, (rows, dimensions)).tolist()
+    return RNG.uniform(min_val, max_val, (rows, dimensions)).tolist()
 
 
+# Vector values are float32 ndarrays throughout, they are never converted to
+# Python float lists
 def generate_random_vector_with_id(id, length):
-    values = np.random.uniform(-1, 1, length).tolist()
+    values = RNG.uniform(-1, 1, length).astype(np.float32)
     return {"id": id, "values": values}
 
 
 def perturb_vector(vector, perturbation_degree):
+    values = vector["values"]
     # Generate the perturbation
-    perturbation = np.random.uniform(
-        -perturbation_degree, perturbation_degree, len(vector["values"])
-    )
-    # Apply the perturbation and clamp the values within the range of -1 to 1
-    perturbed_values = np.array(vector["values"]) + perturbation
-    clamped_values = np.clip(perturbed_values, -1, 1)
-    vector["values"] = clamped_values.tolist()
+    perturbation = RNG.uniform(
+        -perturbation_degree, perturbation_degree, values.shape
+    ).astype(np.float32)
+    # Apply the perturbation and clamp the values within the range of -1 to 1,
+    # both in place
+    np.add(values, perturbation, out=values)
+    np.clip(values, -1, 1, out=values)
     return vector
 
 
-def dot_product(vec1, vec2):
-    return sum(v1 * v2 for v1, v2 in zip(vec1, vec2))
-
-
-def magnitude(vec):
-    return np.sqrt(sum(v**2 for v in vec))
-
-
-def cosine_similarity(vec1, vec2):
-    dot_prod = dot_product(vec1, vec2)
-    magnitude_vec1 = magnitude(vec1)
-    magnitude_vec2 = magnitude(vec2)
-
-    if magnitude_vec1 == 0 or magnitude_vec2 == 0:
-        return 0.0  # Handle the case where one or both vectors are zero vectors
-
-    return dot_prod / (magnitude_vec1 * magnitude_vec2)
-
-
 def generate_perturbation(base_vector, idd, perturbation_degree, dimensions):
     # Generate the perturbation
-    perturbation = np.random.uniform(
+    perturbation = RNG.uniform(
         -perturbation_degree, perturbation_degree, dimensions
-    )
+    ).astype(np.float32)
 
     # Apply the perturbation and clamp the values within the range of -1 to 1
-    # perturbed_values = base_vector["values"] + perturbation
-    perturbed_values = np.array(base_vector["values"]) + perturbation
-    clamped_values = np.clip(perturbed_values, -1, 1)
+    perturbation += base_vector["values"]
+    np.clip(perturbation, -1, 1, out=perturbation)
 
-    perturbed_vector = {"id": idd, "values": clamped_values.tolist()}
+    perturbed_vector = {"id": idd, "values": perturbation}
     # print(base_vector["values"][:10])
     # print( perturbed_vector["values"][:10] )
     # cs = cosine_similarity(base_vector["values"], perturbed_vector["values"] )
@@ -281,50 +370,37 @@ def generate_perturbation(base_vector, idd, perturbation_degree, dimensions):
     #     shortlisted_vectors.append(perturbed_vector)
 
 
-def process_base_vector_batch(
+async def process_base_vector_batch(
     req_ct, base_idx, vector_db_name, transaction_id, dimensions, perturbation_degree
 ):
     try:
+        base_id = req_ct * 10000 + base_idx * 100
+
         # Generate one base vector
-        base_vector = generate_random_vector_with_id(
-            req_ct * 10000 + base_idx * 100, dimensions
-        )
+        base_vector = generate_random_vector_with_id(base_id, dimensions)
+        base = base_vector["values"]
 
-        # Create batch containing base vector and its perturbations
-        batch_vectors = [base_vector]  # Start with base vector
-
-        # Generate 99 perturbations for this base vector
-        for i in range(99):
-            perturbed_vector = generate_perturbation(
-                base_vector,
-                req_ct * 10000
-                + base_idx * 100
-                + i
-                + 1,  # Unique ID for each perturbation
-                perturbation_degree,
-                dimensions,
-            )
-            batch_vectors.append(perturbed_vector)
+        # Generate 99 perturbations for this base vector in one shot
+        perturbations = RNG.uniform(
+            -perturbation_degree, perturbation_degree, (99, dimensions)
+        ).astype(np.float32)
+        perturbed = np.clip(base[None, :] + perturbations, -1, 1)
 
-        # Submit this base vector and its perturbations as one batch
-        upsert_in_transaction(vector_db_name, transaction_id, batch_vectors)
-        print(
-            f"Upsert complete for base vector {base_idx} and its {len(batch_vectors) - 1} perturbations"
-        )
+        # Create batch containing base vector and its perturbations, each
+        # perturbation gets a unique ID following the base vector's
+        batch_vectors = [base_vector] + [
+            {"id": base_id + i + 1, "values": row} for i, row in enumerate(perturbed)
+        ]
 
-        return (
+        # Submit this base vector and its perturbations as one batch
+        await upsert_in_transaction(vector_db_name, transaction_id, batch_vectors)
+        logger.debug(
+            "Upsert complete for base vector %d and its %d perturbations",
             base_idx,
-            generate_perturbation(
-                base_vector,
-                req_ct * 10000
-                + base_idx * 100
-                + i
-                + 1,  # Unique ID for each perturbation
-                perturbation_degree,
-                dimensions,
-            ),
-            batch_vectors,
+            len(batch_vectors) - 1,
         )
+
+        return (base_idx, batch_vectors[-1], batch_vectors)
     except Exception as e:
         print(f"Error processing base vector {base_idx}: {e}")
         raise
@@ -339,54 +415,267 @@ def cosine_similarity(vec1, vec2):
     if vec1.shape != vec2.shape:
         raise ValueError("Vectors must have the same length")
 
-    # Calculate magnitudes
-    magnitude1 = np.linalg.norm(vec1)
-    magnitude2 = np.linalg.norm(vec2)
+    # Product of the squared magnitudes, one sqrt covers both norms
+    squared_magnitudes = np.vdot(vec1, vec1) * np.vdot(vec2, vec2)
 
     # Check for zero vectors
-    if magnitude1 == 0 or magnitude2 == 0:
+    if squared_magnitudes == 0:
         raise ValueError("Cannot compute cosine similarity for zero vectors")
 
-    # Calculate dot product
-    dot_product = np.dot(vec1, vec2)
+    return np.dot(vec1, vec2) / np.sqrt(squared_magnitudes)
+
+
+def normalize(values):
+    # L2-normalize along the last axis in place
+    norms = np.linalg.norm(values, axis=-1, keepdims=True)
+    values /= np.maximum(norms, 1e-12)
+    return values
+
+
+def quantize(values):
+    # Symmetric int8 quantization with one scale per vector, so every vector
+    # uses the full [-127, 127] range regardless of its magnitude
+    scales = 127 / np.maximum(np.abs(values).max(axis=-1), 1e-12)
+    codes = np.rint(values * scales[..., None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes, scales, lo, hi):
+    return codes[lo:hi] / scales[lo:hi, None]
+
+
+def load_gpu_corpus(codes, scales):
+    # Dequantize the corpus once into a resident L2-normalized GPU tensor for
+    # brute-force search, None when torch or a CUDA device is unavailable
+    if torch is None or not torch.cuda.is_available():
+        return None
+
+    matrix = torch.empty(codes.shape, dtype=torch.float32, device="cuda")
+    for lo in range(0, len(codes), BRUTEFORCE_BLOCK):
+        hi = min(lo + BRUTEFORCE_BLOCK, len(codes))
+        block = torch.from_numpy(codes[lo:hi]).to("cuda").float()
+        block /= torch.from_numpy(scales[lo:hi]).to("cuda")[:, None]
+        matrix[lo:hi] = F.normalize(block, dim=1)
+    return matrix
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def topk_cosine(codes, scales, q, k):
+        # Scores every int8 row against the query in parallel, applying the
+        # row's scale to the dot product, then keeps the k best in a sorted
+        # buffer. Returns row positions and similarities, best first.
+        n, d = codes.shape
+        similarities = np.empty(n, dtype=np.float32)
+        for i in numba.prange(n):
+            acc = np.float32(0.0)
+            for j in range(d):
+                acc += np.float32(codes[i, j]) * q[j]
+            similarities[i] = acc / scales[i]
+
+        top = np.full(k, -1, dtype=np.int64)
+        top_similarities = np.full(k, -np.inf, dtype=np.float32)
+        for i in range(n):
+            similarity = similarities[i]
+            if similarity <= top_similarities[k - 1]:
+                continue
+            j = k - 1
+            while j > 0 and top_similarities[j - 1] < similarity:
+                top_similarities[j] = top_similarities[j - 1]
+                top[j] = top[j - 1]
+                j -= 1
+            top_similarities[j] = similarity
+            top[j] = i
+        return top, top_similarities
+
+
+def bruteforce_search(ids, codes, scales, query, k=5, gpu_corpus=None):
+    k = min(k, len(ids))
+
+    if gpu_corpus is not None:
+        q = F.normalize(
+            torch.as_tensor(query["values"], dtype=torch.float32, device="cuda"),
+            dim=0,
+        )
+        similarities, top = torch.topk(gpu_corpus @ q, k)
+        return list(zip(ids[top.cpu().numpy()].tolist(), similarities.cpu().tolist()))
+
+    if numba is not None:
+        q = np.ascontiguousarray(query["values"], dtype=np.float32)
+        top, similarities = topk_cosine(codes, scales, q, k)
+        return list(zip(ids[top].tolist(), similarities.tolist()))
+
+    # Rows are normalized before quantization, so the dot product is the
+    # cosine up to int8 rounding. The corpus is dequantized a block at a
+    # time, the scale is applied to the block's dot products rather than to
+    # every element.
+    q = np.ascontiguousarray(query["values"], dtype=np.float32)
+    similarities = np.empty(len(ids), dtype=np.float32)
+    for lo in range(0, len(ids), BRUTEFORCE_BLOCK):
+        hi = min(lo + BRUTEFORCE_BLOCK, len(ids))
+        block = codes[lo:hi].astype(np.float32)
+        if simsimd is not None:
+            # SIMD dot-product kernels, falls back to the BLAS matmul below
+            distances = simsimd.cdist(block, q[None, :], metric="dot")
+            similarities[lo:hi] = np.asarray(distances)[:, 0]
+        else:
+            similarities[lo:hi] = block @ q
+    similarities /= scales
+
+    # Select the top k without sorting the full similarity array
+    top = np.argpartition(-similarities, k - 1)[:k]
+    top = top[np.argsort(-similarities[top])]
+
+    return list(zip(ids[top].tolist(), similarities[top].tolist()))
 
-    # Calculate cosine similarity
-    cosine_sim = dot_product / (magnitude1 * magnitude2)
 
-    return cosine_sim
+def generate_vectors(
+    txn_count, batch_count, batch_size, dimensions, perturbation_degree
+):
+    count = txn_count * batch_count * batch_size
+    # The corpus is kept as a single contiguous (N, D) int8 matrix with an
+    # (N,) scale per vector next to an (N,) id array, per-vector dicts are
+    # only built per upsert batch
+    codes = np.empty((count, dimensions), dtype=np.int8)
+    scales = np.empty(count, dtype=np.float32)
+
+    # Generate in blocks so the float32 corpus is never materialized at once
+    for lo in range(0, count, GENERATE_BLOCK):
+        hi = min(lo + GENERATE_BLOCK, count)
+        values = RNG.random((hi - lo, dimensions), dtype=np.float32)
+        # Rescale [0, 1) to [-1, 1) in place
+        values *= 2
+        values -= 1
+        normalize(values)
+        codes[lo:hi], scales[lo:hi] = quantize(values)
+
+    # Shuffle the ids instead of the rows, every row is an independent draw
+    ids = RNG.permutation(count)
+    return ids, codes, scales
+
+
+def slice_batch(codes, scales, ids, lo, hi):
+    # The server only accepts float values, so the batch is dequantized here.
+    # Rows stay ndarray views, orjson serializes them from their buffers.
+    return [
+        {"id": id, "values": row}
+        for id, row in zip(ids[lo:hi].tolist(), dequantize(codes, scales, lo, hi))
+    ]
 
 
-def bruteforce_search(vectors, query, k=5):
-    similarities = []
-    for vector in vectors:
-        similarity = cosine_similarity(query["values"], vector["values"])
-        similarities.append((vector["id"], similarity))
+def search(ids, codes, scales, vector_db_name, query, gpu_corpus=None):
+    query = {
+        "id": query["id"],
+        "values": normalize(np.array(query["values"], dtype=np.float32)),
+    }
+    ann_response = ann_vector(query["id"], vector_db_name, query["values"])
+    bruteforce_result = bruteforce_search(
+        ids, codes, scales, query, 5, gpu_corpus=gpu_corpus
+    )
+    return (ann_response, bruteforce_result)
 
-    similarities.sort(key=lambda x: x[1], reverse=True)
 
-    return similarities[:k]
+# Corpus and current batch size of an encoder process, set by init_encoder
+_encoder_corpus = None
+_encoder_batch_vectors = MACRO_BATCH
 
 
-def generate_vectors(
-    txn_count, batch_count, batch_size, dimensions, perturbation_degree
-):
-    vectors = [
-        generate_random_vector_with_id(id, dimensions)
-        for id in range(txn_count * batch_count * batch_size)
-    ]
+def share_codes(codes, path):
+    # Moves the codes matrix into a memory-mapped file that the encoder
+    # processes map as well, so the corpus is not pickled for each of them
+    shared = np.memmap(path, dtype=np.int8, mode="w+", shape=codes.shape)
+    shared[:] = codes
+    shared.flush()
+    return np.memmap(path, dtype=np.int8, mode="r", shape=codes.shape)
 
-    # Shuffle the vectors
-    np.random.shuffle(vectors)
-    return vectors
 
+def init_encoder(path, shape, ids, scales):
+    global _encoder_corpus
+    codes = np.memmap(path, dtype=np.int8, mode="r", shape=shape)
+    _encoder_corpus = (ids, codes, scales)
 
-def search(vectors, vector_db_name, query):
-    ann_response = ann_vector(query["id"], vector_db_name, query["values"])
-    bruteforce_result = bruteforce_search(vectors, query, 5)
-    return (ann_response, bruteforce_result)
 
+def encode_range(lo, hi):
+    # Runs in an encoder process and returns the upsert bodies for rows lo..hi
+    global _encoder_batch_vectors
+    ids, codes, scales = _encoder_corpus
+    payloads = []
+    batch_start = lo
+    while batch_start < hi:
+        batch_end = min(batch_start + _encoder_batch_vectors, hi)
+        body = encode_upsert_payload(
+            slice_batch(codes, scales, ids, batch_start, batch_end)
+        )
+        # Halve the batch until its body fits under the server's limit,
+        # the smaller size sticks for the rest of the process
+        if len(body) > MAX_BODY_BYTES and batch_end - batch_start > 1:
+            _encoder_batch_vectors = (batch_end - batch_start) // 2
+            continue
+        payloads.append((batch_start, batch_end, body))
+        batch_start = batch_end
+    return payloads
+
+
+def prefetch_payloads(pool, lo, hi):
+    # Encodes the upsert bodies for rows lo..hi ahead of the uploader, the
+    # bounded queue keeps at most PREFETCH_BATCHES encoded bodies waiting
+    payloads = asyncio.Queue(maxsize=PREFETCH_BATCHES)
+
+    async def produce():
+        loop = asyncio.get_running_loop()
+        in_flight = collections.deque()
+        try:
+            # Serialization holds the GIL, so macro batches are encoded in
+            # the pool and handed over in order as they complete
+            for start in range(lo, hi, MACRO_BATCH):
+                in_flight.append(
+                    loop.run_in_executor(
+                        pool, encode_range, start, min(start + MACRO_BATCH, hi)
+                    )
+                )
+                if len(in_flight) < ENCODE_WORKERS:
+                    continue
+                for payload in await in_flight.popleft():
+                    await payloads.put(payload)
+            while in_flight:
+                for payload in await in_flight.popleft():
+                    await payloads.put(payload)
+            await payloads.put(None)
+        except Exception as e:
+            await payloads.put(e)
 
-if __name__ == "__main__":
+    return payloads, asyncio.create_task(produce())
+
+
+async def upload_payloads(
+    collection_name, transaction_id, ids, codes, scales, payloads, semaphore
+):
+    tasks = []
+    while True:
+        # Take a slot before pulling the next body so that only in-flight
+        # and prefetched bodies are held in memory
+        await semaphore.acquire()
+        payload = await payloads.get()
+        if payload is None or isinstance(payload, Exception):
+            semaphore.release()
+            if payload is None:
+                break
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise payload
+        lo, hi, body = payload
+        task = asyncio.create_task(
+            upsert_range_in_transaction(
+                collection_name, transaction_id, ids, codes, scales, lo, hi, body
+            )
+        )
+        task.add_done_callback(lambda _: semaphore.release())
+        tasks.append(task)
+
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def main():
     # Create database
     vector_db_name = "testdb"
     dimensions = 1024
@@ -397,6 +686,8 @@ if __name__ == "__main__":
     batch_count = 977
     txn_count = 2
 
+    listener = setup_logging(os.environ.get("LOG_LEVEL", "INFO"))
+
     session_response = create_session()
     print("Session Response:", session_response)
 
@@ -408,63 +699,104 @@ if __name__ == "__main__":
     print("Create Collection(DB) Response:", create_collection_response)
     # create_explicit_index(vector_db_name)
 
-    vectors = generate_vectors(
+    ids, codes, scales = generate_vectors(
         txn_count, batch_count, batch_size, dimensions, perturbation_degree
     )
 
-    start_time = time.time()
+    corpus_fd, corpus_path = tempfile.mkstemp(suffix=".codes")
+    os.close(corpus_fd)
+    pool = None
+    # Interrupted or failed runs must not leave the corpus file behind
+    try:
+        codes = share_codes(codes, corpus_path)
+        # Spawned rather than forked, the logging listener thread is already running
+        pool = ProcessPoolExecutor(
+            max_workers=ENCODE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_encoder,
+            initargs=(corpus_path, codes.shape, ids, scales),
+        )
 
-    for req_ct in range(txn_count):
-        transaction_id = None
-        try:
-            # Create a new transaction
-            transaction_response = create_transaction(vector_db_name)
-            transaction_id = transaction_response["transaction_id"]
-            print(f"Created transaction: {transaction_id}")
-
-            # Process vectors concurrently
-            with ThreadPoolExecutor(max_workers=64) as executor:
-                futures = []
-                for base_idx in range(batch_count):
-                    req_start = req_ct * batch_count * batch_size
-                    batch_start = req_start + base_idx * batch_size
-                    # upsert_in_transaction(vector_db_name, transaction_id, vectors[batch_start:batch_start+batch_size])
-                    futures.append(
-                        executor.submit(
-                            upsert_in_transaction,
-                            vector_db_name,
-                            transaction_id,
-                            vectors[batch_start : batch_start + batch_size],
-                        )
-                    )
+        # Caps the number of upserts in flight at once
+        semaphore = asyncio.Semaphore(64)
 
-                # Collect results
-                for future in as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        print(f"Error in future: {e}")
+        start_time = time.time()
 
-            # Commit the transaction after all vectors are inserted
-            commit_response = commit_transaction(vector_db_name, transaction_id)
-            print(f"Committed transaction {transaction_id}: {commit_response}")
-            transaction_id = None
-            # time.sleep(10)
+        # Only one transaction can be open per collection, so the next one cannot
+        # be created before the commit returns. Its upsert bodies are encoded while
+        # the commit is in flight instead.
+        txn_size = batch_count * batch_size
+        next_payloads = prefetch_payloads(pool, 0, txn_size)
 
-        except Exception as e:
-            print(f"Error in transaction: {e}")
-            if transaction_id:
-                try:
-                    abort_transaction(vector_db_name, transaction_id)
-                    print(f"Aborted transaction {transaction_id} due to error")
-                except Exception as abort_error:
-                    print(f"Error aborting transaction: {abort_error}")
+        for req_ct in range(txn_count):
+            txn_start = req_ct * txn_size
+            payloads, producer = next_payloads or prefetch_payloads(
+                pool, txn_start, txn_start + txn_size
+            )
+            next_payloads = None
+            transaction_id = None
+            try:
+                # Create a new transaction
+                transaction_response = create_transaction(vector_db_name)
+                transaction_id = transaction_response["transaction_id"]
+                print(f"Created transaction: {transaction_id}")
+
+                # Process vectors concurrently
+                results = await upload_payloads(
+                    vector_db_name,
+                    transaction_id,
+                    ids,
+                    codes,
+                    scales,
+                    payloads,
+                    semaphore,
+                )
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f"Error in upsert: {result}")
+
+                if req_ct + 1 < txn_count:
+                    next_payloads = prefetch_payloads(
+                        pool,
+                        txn_start + txn_size,
+                        txn_start + 2 * txn_size,
+                    )
 
-    # End time
-    end_time = time.time()
+                # Commit the transaction after all vectors are inserted, off the
+                # event loop so the next transaction keeps encoding meanwhile
+                commit_response = await asyncio.to_thread(
+                    commit_transaction, vector_db_name, transaction_id
+                )
+                print(f"Committed transaction {transaction_id}: {commit_response}")
+                transaction_id = None
+                # time.sleep(10)
+
+            except Exception as e:
+                print(f"Error in transaction: {e}")
+                if transaction_id:
+                    try:
+                        abort_transaction(vector_db_name, transaction_id)
+                        print(f"Aborted transaction {transaction_id} due to error")
+                    except Exception as abort_error:
+                        print(f"Error aborting transaction: {abort_error}")
+            finally:
+                producer.cancel()
+
+        # End time
+        end_time = time.time()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        os.remove(corpus_path)
+        await client.aclose()
+        listener.stop()
 
     # Calculate elapsed time
     elapsed_time = end_time - start_time
 
     # Print elapsed time
     print(f"Elapsed time: {elapsed_time} seconds")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())